@@ -1,40 +1,48 @@
+from __future__ import annotations
+
 import argparse
 import re
 import statistics
 import os
 import textwrap
 from collections import OrderedDict
-from typing import Dict, Tuple, List, Literal, Optional
-
-import pandas as pd
+from functools import lru_cache
+from itertools import chain
+from typing import Any, Callable, Dict, Tuple, List, Literal, Optional
 
-METRICS = {
+METRICS: Dict[str, Dict[str, Any]] = {
     'MB/s': {'name': 'B/s', 'good_direction': 'up', 'scale': 2 ** 20},
     'values/s': {'good_direction': 'up'},
     # 'ns/op': {'name': 's/op', 'good_direction': 'down', 'scale': 1e-9},
     # 'rows/s': {'good_direction': 'up'},
 }
 
+METRIC_ITEMS = tuple(METRICS.items())
+
+BENCHMARK_NAME_RE = re.compile(r'Benchmark(?P<base>.*?)(?:/(?P<params>[^/]*))?$')
+
 EMOJIS = {
     'good': '⚡️',
     'bad': '💔'
 }
 
+# below this number of runs sorting in statistics.median is cheaper than converting values to numpy array
+MEDIAN_SELECTION_THRESHOLD = 16
 
-def format_benchmark_name(name: str) -> str:
-    name = name.replace("Benchmark", "")
-    name = name.replace("/CI/", "/")
 
-    parts = name.split("/")
-    if len(parts) == 1:
-        return parts[0]
+# the same raw name comes once per run in both old and new results
+@lru_cache(maxsize=4096)
+def format_benchmark_name(name: str) -> str:
+    match = BENCHMARK_NAME_RE.match(name.replace("/CI/", "/"))
+    if match is None:
+        return name
 
-    base_name = " ".join(parts[:-1])
-    params_split = parts[-1].split("-")
+    base_name = match["base"].replace("/", " ")
+    if match["params"] is None:
+        return base_name
 
-    params = []
-    for i in range(0, len(params_split) - 1, 2):
-        params.append(f"{params_split[i]}={params_split[i + 1]}")
+    params_split = iter(match["params"].split("-"))
+    params = [f"{key}={value}" for key, value in zip(params_split, params_split)]
 
     if params:
         return f"{base_name} ({', '.join(params)})"
@@ -52,13 +60,17 @@ def parse_bench_line(line: str) -> Tuple[Optional[str], Optional[Dict[str, float
     ('Partitioning (cpu=4)', {'ns/op': 475.5, 'MB/s': 218.73, 'rows/s': 8412793, 'values/s': 16825587}
     """
 
-    parts = re.split(r'\s+', line.strip())
+    # cheap substring check skips non-benchmark lines of the output before tokenizing them
+    if "/CI/" not in line:
+        return None, None
+
+    parts = line.split()
     if len(parts) < 3 or not parts[0].startswith("Benchmark") or "/CI/" not in parts[0]:
         return None, None
 
     bench_name = format_benchmark_name(parts[0])
 
-    metrics = {}
+    metrics: Dict[str, float] = {}
     for value, metric in zip(parts[2::2], parts[3::2]):
         if metric not in METRICS:
             continue
@@ -71,61 +83,86 @@ def parse_bench_line(line: str) -> Tuple[Optional[str], Optional[Dict[str, float
 
 
 def parse_metrics_file(path: str) -> Dict[str, Dict[str, List[float]]]:
-    results = {}
+    results: Dict[str, Dict[str, List[float]]] = {}
 
     with open(path) as f:
-        for line in f:
-            name_test, metrics = parse_bench_line(line)
-            if name_test is None:
-                continue
+        lines = f.read().splitlines()
 
-            if not metrics:
-                continue
+    for line in lines:
+        name_test, metrics = parse_bench_line(line)
+        if name_test is None:
+            continue
 
-            if name_test not in results:
-                results[name_test] = {m: [] for m in METRICS.keys()}
+        if not metrics:
+            continue
 
-            for metric_name, value in metrics.items():
-                results[name_test][metric_name].append(value)
+        # lists are created only for metrics the benchmark actually reports
+        bench_results = results.setdefault(name_test, {})
+        for metric_name, value in metrics.items():
+            bench_results.setdefault(metric_name, []).append(value)
 
     return results
 
 
+def median(values: List[float]) -> float:
+    if len(values) < MEDIAN_SELECTION_THRESHOLD:
+        return statistics.median(values)
+
+    # imported lazily, so reports with a few runs per benchmark do not pay for numpy import
+    import numpy as np
+
+    arr = np.array(values, dtype=np.float64)
+    k = len(arr) // 2
+
+    if len(arr) % 2 == 1:
+        arr.partition(k)
+        return float(arr[k])
+
+    arr.partition((k - 1, k))
+    return float((arr[k - 1] + arr[k]) / 2)
+
+
+AGGREGATIONS: Dict[str, Callable[[List[float]], float]] = {
+    'mean': statistics.fmean,
+    'median': median,
+}
+
+
 def aggregate_results(
         parsed_metrics: Dict[str, Dict[str, List[float]]],
         method: Literal["mean", "median"]
 ) -> OrderedDict[str, Dict[str, float]]:
-    aggregated: OrderedDict[str, Dict[str, float]] = OrderedDict()
-
-    for bench_name, metrics in parsed_metrics.items():
-        aggregated[bench_name] = {}
+    aggregate = AGGREGATIONS[method]
 
-        for m, values in metrics.items():
-            if method == "median":
-                aggregated[bench_name][m] = statistics.median(values)
-            elif method == "mean":
-                aggregated[bench_name][m] = statistics.mean(values)
-
-    return aggregated
+    return OrderedDict(
+        (bench_name, {m: aggregate(values) for m, values in metrics.items()})
+        for bench_name, metrics in parsed_metrics.items()
+    )
 
 
-def humanize_number(val: float, scale: float) -> str:
+def humanize_number(val: Optional[float], scale: float) -> str:
     if val is None:
         return "?"
 
     val = val * scale
-    abs_val = abs(val)
+    abs_val = val if val >= 0 else -val
     if abs_val >= 1_000_000:
-        return f"{val / 1_000_000:.2f}M"
+        return "%.2fM" % (val / 1_000_000)
     elif abs_val >= 1_000:
-        return f"{val / 1_000:.2f}K"
+        return "%.2fK" % (val / 1_000)
     else:
-        return f"{val:.2f}"
+        return "%.2f" % val
 
 
-def format_metric_changes(metric_name: str, old_val, new_val: Optional[float], alert_threshold: float) -> str:
-    old_val_str = humanize_number(old_val, METRICS[metric_name].get('scale', 1))
-    new_val_str = humanize_number(new_val, METRICS[metric_name].get('scale', 1))
+def format_metric_changes(
+        old_val: Optional[float],
+        new_val: Optional[float],
+        scale: float,
+        good_direction: Optional[str],
+        alert_threshold: float
+) -> str:
+    old_val_str = humanize_number(old_val, scale)
+    new_val_str = humanize_number(new_val, scale)
 
     if old_val is None or new_val is None:
         suffix = " ⚠️"
@@ -134,46 +171,70 @@ def format_metric_changes(metric_name: str, old_val, new_val: Optional[float], a
         suffix = f" ({change_pct:+.2f}%)"
 
         if abs(change_pct) >= alert_threshold:
-            is_better = METRICS[metric_name].get('good_direction') == 'up' and change_pct > 0
+            is_better = good_direction == 'up' and change_pct > 0
             suffix += f" {EMOJIS['good'] if is_better else EMOJIS['bad']}"
 
     return f"{old_val_str} → {new_val_str}{suffix}"
 
 
-def compare_benchmarks_df(old_metrics, new_metrics, alert_threshold=None):
+def compare_benchmarks_df(
+        old_metrics: Optional[Dict[str, Dict[str, float]]],
+        new_metrics: Optional[Dict[str, Dict[str, float]]],
+        alert_threshold: float = 7
+) -> str:
     if old_metrics is None:
         old_metrics = {}
 
     if new_metrics is None:
         new_metrics = {}
 
-    all_metrics = OrderedDict()
-    all_metrics.update(old_metrics)
-    all_metrics.update(new_metrics)
+    # benchmarks in order of first appearance: old ones first, then the ones only present in new results
+    bench_names = dict.fromkeys(chain(old_metrics, new_metrics))
 
-    df = pd.DataFrame(columns=["Benchmark"] + [v.get('name', k) for k, v in METRICS.items()])
+    columns = [
+        (
+            metric_name,
+            metric_params.get('name', metric_name),
+            metric_params.get('scale', 1),
+            metric_params.get('good_direction'),
+        )
+        for metric_name, metric_params in METRIC_ITEMS
+    ]
 
-    for bench_name in all_metrics.keys():
-        row = {"Benchmark": bench_name}
+    rows: List[List[str]] = []
 
-        for metric_name, metric_params in METRICS.items():
+    for bench_name in bench_names:
+        row = [bench_name]
+
+        for metric_name, column_name, scale, good_direction in columns:
             old_val = old_metrics.get(bench_name, {}).get(metric_name, None)
             new_val = new_metrics.get(bench_name, {}).get(metric_name, None)
-            row[metric_params.get('name', metric_name)] = format_metric_changes(
-                metric_name, old_val, new_val, alert_threshold
-            )
+            row.append(format_metric_changes(old_val, new_val, scale, good_direction, alert_threshold))
+
+        rows.append(row)
+
+    return build_markdown_table(["Benchmark"] + [column_name for _, column_name, _, _ in columns], rows)
+
+
+def build_markdown_table(header: List[str], rows: List[List[str]]) -> str:
+    lines = [
+        f"| {' | '.join(header)} |",
+        f"|{'|'.join(':---' for _ in header)}|",
+    ]
 
-        df.loc[len(df)] = row
+    for row in rows:
+        lines.append(f"| {' | '.join(row)} |")
 
-    return df.to_markdown(index=False)
+    return "\n".join(lines)
 
 
-def build_report_header(old_file, sha_file: str) -> str:
+def build_report_header(old_file: str, sha_file: Optional[str]) -> str:
     event_name = os.environ.get("GITHUB_EVENT_NAME", "")
     base_branch = os.environ.get("GITHUB_DEFAULT_BRANCH", "master")
+    old_exists = os.path.exists(old_file)
 
     warning = ""
-    if not os.path.exists(old_file):
+    if not old_exists:
         warning = textwrap.dedent("""
             > [!WARNING]
             > No test results found for master branch. Please run workflow on master first to compare results.
@@ -181,9 +242,9 @@ def build_report_header(old_file, sha_file: str) -> str:
 
     if event_name == "pull_request":
         pr_branch = os.environ.get("GITHUB_HEAD_REF", "")
-        header_ending = f"`{pr_branch}`" if not os.path.exists(old_file) else f"`{base_branch}` VS `{pr_branch}`"
+        header_ending = f"`{pr_branch}`" if not old_exists else f"`{base_branch}` VS `{pr_branch}`"
     else:
-        if not os.path.exists(old_file):
+        if not old_exists:
             header_ending = f"`{base_branch}`"
         else:
             prev_master_sha = "(sha not found)"
@@ -198,14 +259,14 @@ def build_report_header(old_file, sha_file: str) -> str:
     return f"{warning}\n\n{header}" if warning else header
 
 
-def main():
+def main() -> None:
     parser = argparse.ArgumentParser(description="Compare go test -bench results in markdown format")
     parser.add_argument(
         "--alert-threshold", type=float, default=7,
         help="Percent change threshold for adding emoji alerts"
     )
     parser.add_argument(
-        "--aggregation", choices=["mean", "median"], default="mean",
+        "--aggregation", choices=list(AGGREGATIONS), default="mean",
         help="Aggregation method for multiple runs of the same benchmark"
     )
     parser.add_argument("--old-commit-sha-path", help="Path to file with sha commit of the old benchmark")
@@ -1,33 +1,40 @@
 import re
 
+# All specific links are matched by one pattern compiled on import, so every page is scanned only once
+_LINK_RE = re.compile(
+    r'\[(?P<text>[^]]+)](?P<sep>\(|:\s*)'
+    r'(?:'
+    r'(?P<changelog>[^)\s]*CHANGELOG\.md)'
+    r'|(?P<license>[^)\s]*LICENSE)'
+    r'|(?:\.\./){2}(?:asset/(?P<asset>[^)\s]+\.(?:png|jpg))|(?!asset/)(?P<code>[^)\s]+))'
+    r')'
+    r'(?P<end>\)|\s*)'
+)
+
+# Every link matched by the pattern above contains one of these substrings
+_LINK_MARKERS = ('CHANGELOG.md', 'LICENSE', '../../')
+
+
+def _replace_link(match, repo_url):
+    if match['changelog'] is not None:
+        # Replace link from /CHANGELOG.md to page with changelog
+        target = 'changelog.md'
+    elif match['license'] is not None:
+        # Replace link from /LICENSE to page with license
+        target = 'license.md'
+    elif match['asset'] is not None:
+        # Replace links for images
+        target = f'assets/images/{match["asset"]}'
+    else:
+        # Replace links for code
+        target = f'{repo_url}/tree/master/{match["code"]}'
+
+    return f'[{match["text"]}]{match["sep"]}{target}{match["end"]}'
+
 
 def replace_specific_links(markdown, *, page, config, files, **kwargs):
-    # Replace link from /CHANGELOG.md to page with changelog
-    markdown = re.sub(
-        r'\[([^]]+)](\(|:\s*).*CHANGELOG.md(\)|\s*)',
-        r'[\1]\2changelog.md\3',
-        markdown
-    )
-
-    # Replace link from /LICENSE to page with license
-    markdown = re.sub(
-        r'\[([^]]+)](\(|:\s*).*LICENSE(\)|\s*)',
-        r'[\1]\2license.md\3',
-        markdown
-    )
-
-    # Replace links for images
-    markdown = re.sub(
-        r'\[([^]]+)](\(|:\s*)(?:\.\./){2}asset/(.+\.(?:png|jpg))(\)|\s*)',
-        rf'[\1]\2assets/images/\3\4',
-        markdown
-    )
-
-    # Replace links for code
-    markdown = re.sub(
-        r'\[([^]]+)](\(|:\s*)(?:\.\./){2}(?!asset/)(.+)(\)|\s*)',
-        rf'[\1]\2{config.repo_url}/tree/master/\3\4',
-        markdown
-    )
-
-    return markdown
+    # Most pages have no such links, substring search is much cheaper than a regex scan
+    if not any(marker in markdown for marker in _LINK_MARKERS):
+        return markdown
+
+    return _LINK_RE.sub(lambda match: _replace_link(match, config.repo_url), markdown)